@@ -0,0 +1,205 @@
+"""
+Asynchronous batching writer for database events.
+
+This module provides the EventBatcher used to persist events without one
+round-trip (and one task) per event:
+- Producers put events on a bounded queue and return immediately
+- A single long-running consumer task coalesces queued events
+- A batch is written once it is full or the flush interval has elapsed
+- A full queue applies backpressure to producers instead of growing unbounded
+- flush() lets a reader wait until earlier events have been written
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+# Sentinel telling the consumer to write what it has and exit
+_STOP = object()
+
+
+class EventBatcher:
+    """
+    Coalesces queued items into batches written by a single consumer task.
+    
+    The queue is created in start(), so the batcher can be instantiated at
+    import time and bound to the running event loop on application startup.
+    """
+    
+    def __init__(
+        self,
+        write_batch: Callable[[List[Any]], Awaitable[None]],
+        batch_size: int = 200,
+        flush_interval_ms: int = 20,
+        maxsize: int = 10000
+    ):
+        """
+        Initialize the batcher.
+        
+        Args:
+            write_batch: Coroutine function that persists one batch of items
+            batch_size: Maximum number of items written per batch (default: 200)
+            flush_interval_ms: Longest time an item waits for its batch to fill (default: 20ms)
+            maxsize: Queue bound; put() waits while the queue is full (default: 10000)
+        """
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.maxsize = maxsize
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushes = 0
+    
+    def start(self) -> None:
+        """
+        Create the queue and start the consumer task.
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self._consume())
+    
+    async def stop(self) -> None:
+        """
+        Write all queued items and stop the consumer task.
+        
+        Items queued behind the stop sentinel (e.g. put while the consumer
+        was finishing its last batch) are written here, so none are lost.
+        """
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            
+            # Write leftover items and release their flush barriers
+            while not self._queue.empty():
+                batch: List[Any] = []
+                barriers: List[asyncio.Future] = []
+                while not self._queue.empty() and len(batch) < self.batch_size:
+                    item = self._queue.get_nowait()
+                    if isinstance(item, asyncio.Future):
+                        barriers.append(item)
+                    elif item is not _STOP:
+                        batch.append(item)
+                
+                if batch:
+                    await self._write(batch)
+                
+                for barrier in barriers:
+                    if not barrier.done():
+                        barrier.set_result(None)
+            
+            self._queue = None
+            self._full = None
+            self._task = None
+    
+    async def put(self, item: Any) -> None:
+        """
+        Queue an item for the next batch.
+        
+        Returns immediately unless the queue is full, in which case it waits
+        for the consumer to make room.
+        
+        Args:
+            item: Item to write
+        
+        Raises:
+            RuntimeError: If the batcher has not been started
+        """
+        if self._queue is None:
+            raise RuntimeError("Event batcher is not running")
+        
+        await self._queue.put(item)
+        
+        # Wake the consumer early once a full batch is waiting
+        if self._queue.qsize() >= self.batch_size - 1:
+            self._full.set()
+    
+    async def flush(self) -> None:
+        """
+        Wait until every item queued before this call has been written.
+        
+        Items whose batch failed count as written; the failure is logged by
+        the consumer. Returns immediately if the batcher is not running.
+        """
+        if self._queue is None:
+            return
+        
+        barrier = asyncio.get_running_loop().create_future()
+        self._flushes += 1
+        try:
+            await self._queue.put(barrier)
+            
+            # Write what is queued now instead of waiting out the flush interval
+            self._full.set()
+            await barrier
+        finally:
+            self._flushes -= 1
+    
+    async def _consume(self) -> None:
+        """
+        Drain the queue in batches until the stop sentinel is received.
+        
+        A flush barrier ends the batch it is found in; it is released once
+        that batch has been written.
+        """
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            
+            batch: List[Any] = []
+            barrier: Optional[asyncio.Future] = None
+            if isinstance(item, asyncio.Future):
+                barrier = item
+            else:
+                batch.append(item)
+                
+                # Wait for the batch to fill, or for the flush interval to
+                # elapse, unless a flush is waiting for this batch
+                if self._queue.qsize() < self.batch_size - 1 and not self._flushes:
+                    self._full.clear()
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+            
+            stop = False
+            while barrier is None and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, asyncio.Future):
+                    barrier = item
+                    break
+                batch.append(item)
+            
+            if batch:
+                await self._write(batch)
+            
+            if barrier is not None and not barrier.done():
+                barrier.set_result(None)
+            
+            if stop:
+                return
+    
+    async def _write(self, batch: List[Any]) -> None:
+        """
+        Write one batch; a failed batch is reported and dropped, so the
+        caller keeps running.
+        
+        Args:
+            batch: Items to write
+        """
+        try:
+            await self.write_batch(batch)
+        except Exception as e:
+            log.error("[EventBatcher] Error writing batch of %d: %s", len(batch), e)
@@ -0,0 +1,54 @@
+"""
+Keyword matching helpers shared by the LLM and summary modules.
+
+Keyword groups are compiled into a single Aho-Corasick automaton so a message
+is classified against every group in one linear pass, instead of one
+substring scan per keyword.
+"""
+
+from typing import Dict, FrozenSet, Iterable, Set
+
+import ahocorasick
+
+
+def build_keyword_automaton(groups: Dict[str, Iterable[str]]) -> ahocorasick.Automaton:
+    """
+    Compile keyword groups into an Aho-Corasick automaton.
+    
+    A keyword may belong to several groups; each match reports all of them.
+    
+    Args:
+        groups: Mapping of group id -> keywords (lowercase)
+    
+    Returns:
+        ahocorasick.Automaton: Automaton whose values are frozensets of group ids
+    """
+    keyword_groups: Dict[str, Set[str]] = {}
+    for group, keywords in groups.items():
+        for keyword in keywords:
+            keyword_groups.setdefault(keyword, set()).add(group)
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, group_ids in keyword_groups.items():
+        automaton.add_word(keyword, frozenset(group_ids))
+    automaton.make_automaton()
+    
+    return automaton
+
+
+def match_keyword_groups(automaton: ahocorasick.Automaton, text: str) -> FrozenSet[str]:
+    """
+    Find every keyword group that occurs in the text.
+    
+    Args:
+        automaton: Automaton built by build_keyword_automaton()
+        text: Casefolded text to scan
+    
+    Returns:
+        Set of matched group ids
+    """
+    hits: Set[str] = set()
+    for _, group_ids in automaton.iter(text):
+        hits |= group_ids
+    
+    return frozenset(hits)
@@ -13,8 +13,38 @@ replaced with a real OpenAI client or other LLM provider.
 """
 
 import asyncio
-import json
-from typing import List, Dict, Any, AsyncGenerator, Optional
+import functools
+import re
+from typing import List, Dict, Any, AsyncGenerator, FrozenSet, Optional, Sequence, Tuple
+import orjson
+from app.keywords import build_keyword_automaton, match_keyword_groups
+
+
+# ============================================================================
+# KEYWORD CLASSIFICATION
+# ============================================================================
+
+# Keyword groups used for tool detection, mode routing and canned responses
+KEYWORD_GROUPS = {
+    # Tool detection
+    "tool_stats": ["stats", "statistics", "user data"],
+    "tool_fetch": ["fetch", "get data", "retrieve"],
+    "query_stats": ["stats"],
+    # Conversation mode routing
+    "analytical": [
+        "analyze", "data", "statistics", "report",
+        "metrics", "performance", "technical"
+    ],
+    # Canned responses
+    "greeting": ["hello", "hi"],
+    "how_are_you": ["how are you"],
+    "websocket": ["websocket", "realtime"],
+    "fastapi": ["fastapi"],
+    "supabase": ["supabase", "database"],
+}
+
+# All keyword groups compiled once at import
+KEYWORD_AUTOMATON = build_keyword_automaton(KEYWORD_GROUPS)
 
 
 # ============================================================================
@@ -75,6 +105,20 @@ AVAILABLE_TOOLS = {
 # TOOL CALLING LOGIC
 # ============================================================================
 
+# Last tool decision per session: session_id -> (casefolded message, tool call)
+_TOOL_DECISIONS: Dict[str, Tuple[str, Optional[Dict[str, Any]]]] = {}
+
+
+def forget_session(session_id: str) -> None:
+    """
+    Drop per-session LLM state once a session ends.
+    
+    Args:
+        session_id: Session identifier
+    """
+    _TOOL_DECISIONS.pop(session_id, None)
+
+
 def detect_tool_call(message: str) -> Optional[Dict[str, Any]]:
     """
     Detect if a user message requires a tool call.
@@ -85,18 +129,29 @@ def detect_tool_call(message: str) -> Optional[Dict[str, Any]]:
     Returns:
         Dict with tool name and arguments if tool call detected, None otherwise
     """
-    message_lower = message.lower()
+    return _tool_call_from_hits(match_keyword_groups(KEYWORD_AUTOMATON, message.casefold()))
+
+
+def _tool_call_from_hits(hits: FrozenSet[str]) -> Optional[Dict[str, Any]]:
+    """
+    Map matched keyword groups of a user message to a tool call.
+    
+    Args:
+        hits: Keyword groups matched in the message
     
+    Returns:
+        Dict with tool name and arguments if tool call detected, None otherwise
+    """
     # Check for stats-related keywords
-    if any(keyword in message_lower for keyword in ["stats", "statistics", "user data"]):
+    if "tool_stats" in hits:
         return {
             "name": "get_user_stats",
             "arguments": {}
         }
     
     # Check for data fetching keywords
-    if any(keyword in message_lower for keyword in ["fetch", "get data", "retrieve"]):
-        query_type = "stats" if "stats" in message_lower else "general"
+    if "tool_fetch" in hits:
+        query_type = "stats" if "query_stats" in hits else "general"
         return {
             "name": "fetch_data",
             "arguments": {"query": query_type}
@@ -137,12 +192,17 @@ async def execute_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, A
 # CONVERSATION MODE ROUTING
 # ============================================================================
 
-def determine_conversation_mode(messages: List[Dict[str, str]]) -> str:
+# Mode routing is a first-sentence heuristic; only this many leading
+# characters of the first message are casefolded and scanned
+MODE_SCAN_CHARS = 512
+
+
+def determine_conversation_mode(messages: Sequence[Dict[str, str]]) -> str:
     """
     Determine conversation mode based on message history.
     
     Args:
-        messages: List of conversation messages
+        messages: Sequence of conversation messages
     
     Returns:
         Conversation mode: "analytical" or "casual"
@@ -150,20 +210,82 @@ def determine_conversation_mode(messages: List[Dict[str, str]]) -> str:
     if not messages:
         return "casual"
     
-    # Check first user message for analytical keywords
-    first_message = messages[0].get("content", "").lower()
+    # Check the opening of the first user message for analytical keywords
+    first_message = messages[0].get("content", "")[:MODE_SCAN_CHARS].casefold()
     
-    analytical_keywords = [
-        "analyze", "data", "statistics", "report", 
-        "metrics", "performance", "technical"
-    ]
+    return _mode_from_hits(match_keyword_groups(KEYWORD_AUTOMATON, first_message))
+
+
+def _mode_from_hits(hits: FrozenSet[str]) -> str:
+    """
+    Map matched keyword groups of the first message to a conversation mode.
+    
+    Args:
+        hits: Keyword groups matched in the first message
     
-    if any(keyword in first_message for keyword in analytical_keywords):
+    Returns:
+        Conversation mode: "analytical" or "casual"
+    """
+    if "analytical" in hits:
         return "analytical"
     
     return "casual"
 
 
+def _classify(
+    messages: Sequence[Dict[str, str]],
+    session_id: str,
+    first_content: Optional[str] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Determine conversation mode and tool call with one scan per message.
+    
+    The opening of the session's first user message decides the mode and
+    the last message the tool call; when they are the same short message it
+    is casefolded and scanned only once. If the last message repeats the
+    session's previous one (e.g. a retry), the previous tool decision is
+    reused without scanning.
+    
+    Args:
+        messages: Sequence of conversation messages
+        session_id: Current session identifier
+        first_content: The session's first user message, which may have
+            dropped out of messages; defaults to the first of messages
+    
+    Returns:
+        Tuple of (conversation mode, tool call or None)
+    """
+    if not messages:
+        return "casual", None
+    
+    if first_content is None:
+        first_content = messages[0].get("content", "")
+    first_message = first_content[:MODE_SCAN_CHARS].casefold()
+    first_hits = match_keyword_groups(KEYWORD_AUTOMATON, first_message)
+    
+    # The first message is scanned once when it is also the last, unless it
+    # runs past the mode window
+    last_content = messages[-1]["content"]
+    if last_content == first_content and len(first_content) <= MODE_SCAN_CHARS:
+        last_message = first_message
+    else:
+        last_message = last_content.casefold()
+    
+    cached = _TOOL_DECISIONS.get(session_id)
+    if cached is not None and cached[0] == last_message:
+        tool_call = cached[1]
+    else:
+        if last_message is first_message:
+            last_hits = first_hits
+        else:
+            last_hits = match_keyword_groups(KEYWORD_AUTOMATON, last_message)
+        
+        tool_call = _tool_call_from_hits(last_hits)
+        _TOOL_DECISIONS[session_id] = (last_message, tool_call)
+    
+    return _mode_from_hits(first_hits), tool_call
+
+
 def get_system_prompt(mode: str) -> str:
     """
     Get system prompt based on conversation mode.
@@ -194,6 +316,80 @@ def get_system_prompt(mode: str) -> str:
 # MOCKED LLM WITH STREAMING
 # ============================================================================
 
+# Token pattern: a run of word characters, or a single space/tab/newline or punctuation mark
+_TOKEN_RE = re.compile(r"[^ \n\t.,!?;:]+|[ \n\t.,!?;:]")
+
+# Canned responses, keyed by the keyword group that triggers them
+CANNED_RESPONSES = {
+    "greeting": "Hello! I'm here to help you. How can I assist you today?",
+    "how_are_you": "I'm functioning perfectly, thank you for asking! I'm ready to help with any questions or tasks you have.",
+    "websocket": "WebSockets enable real-time, bidirectional communication between clients and servers. This is perfect for chat applications, live updates, and streaming data like we're doing right now!",
+    "fastapi": "FastAPI is an excellent modern Python web framework. It's fast, supports async/await natively, has automatic API documentation, and makes building WebSocket applications straightforward.",
+    "supabase": "Supabase is a fantastic open-source Firebase alternative built on PostgreSQL. It provides real-time subscriptions, authentication, storage, and a powerful database with excellent Python client support.",
+}
+
+# Canned responses tokenized once at import: response text -> tokens
+_CANNED_TOKENS = {
+    text: tuple(_TOKEN_RE.findall(text)) for text in CANNED_RESPONSES.values()
+}
+
+
+# Keyword groups with a canned response, in priority order
+_CANNED_PRIORITY = ("greeting", "how_are_you", "websocket", "fastapi", "supabase")
+
+
+# Messages up to this many characters have their canned-response choice
+# memoized; longer ones are scanned every time so they are never cached
+CANNED_CACHE_CHARS = 256
+
+
+def _scan_canned_key(message: str) -> Optional[str]:
+    """
+    Pick the canned response for a message from its keyword groups.
+    
+    Args:
+        message: User message
+    
+    Returns:
+        Key into CANNED_RESPONSES, or None for the generic response
+    """
+    hits = match_keyword_groups(KEYWORD_AUTOMATON, message.casefold())
+    for key in _CANNED_PRIORITY:
+        if key in hits:
+            return key
+    
+    return None
+
+
+# Memoized _scan_canned_key for short messages; repeated messages such as
+# greetings skip the casefold and scan. At most 1024 * CANNED_CACHE_CHARS
+# characters of messages are held.
+_cached_canned_key = functools.lru_cache(maxsize=1024)(_scan_canned_key)
+
+
+def _build_response(message: str, system_prompt: Optional[str]) -> str:
+    """
+    Build the mocked response for a message.
+    
+    Args:
+        message: User message
+        system_prompt: System prompt for context
+    
+    Returns:
+        Generated response string
+    """
+    # Contextual responses based on keywords
+    if len(message) <= CANNED_CACHE_CHARS:
+        key = _cached_canned_key(message)
+    else:
+        key = _scan_canned_key(message)
+    if key is not None:
+        return CANNED_RESPONSES[key]
+    
+    # Generic helpful response
+    return f"I understand you're asking about: '{message}'. I'm here to help! Could you provide more details about what you'd like to know?"
+
+
 class MockedLLM:
     """
     Mocked LLM that simulates OpenAI-compatible streaming behavior.
@@ -202,29 +398,31 @@ class MockedLLM:
     easily replaced with a real OpenAI client.
     """
     
-    def __init__(self, delay_ms: int = 30):
+    def __init__(self, delay_ms: int = 30, tokens_per_frame: int = 4):
         """
         Initialize the mocked LLM.
         
         Args:
             delay_ms: Delay between tokens in milliseconds (default: 30ms)
+            tokens_per_frame: Tokens joined into each yielded chunk (default: 4)
         """
         self.delay_ms = delay_ms
+        self.tokens_per_frame = max(1, tokens_per_frame)
     
     async def stream_completion(
         self,
-        messages: List[Dict[str, str]],
+        messages: Sequence[Dict[str, str]],
         system_prompt: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """
         Stream a completion token by token.
         
         Args:
-            messages: List of conversation messages
+            messages: Sequence of conversation messages
             system_prompt: Optional system prompt to guide response
         
         Yields:
-            Individual tokens (words/punctuation)
+            Text chunks of up to tokens_per_frame tokens (words/punctuation)
         """
         # Get the last user message
         last_message = messages[-1]["content"] if messages else ""
@@ -232,13 +430,33 @@ class MockedLLM:
         # Generate response based on message content
         response = self._generate_response(last_message, system_prompt)
         
-        # Split response into tokens (words and punctuation)
-        tokens = self._tokenize(response)
+        # Split response into tokens (words and punctuation); canned
+        # responses are already tokenized
+        tokens = _CANNED_TOKENS.get(response) or tuple(self._tokenize(response))
         
-        # Stream tokens with delay
-        for token in tokens:
-            await asyncio.sleep(self.delay_ms / 1000.0)
-            yield token
+        # Stream tokens in frames with delay
+        async for chunk in self._stream_tokens(tokens):
+            yield chunk
+    
+    async def _stream_tokens(self, tokens: Sequence[str]) -> AsyncGenerator[str, None]:
+        """
+        Stream tokens in frames, sleeping once per frame.
+        
+        The delay per frame scales with its token count, so the overall
+        pace matches delay_ms per token.
+        
+        Args:
+            tokens: Tokens to stream
+        
+        Yields:
+            Joined chunks of up to tokens_per_frame tokens
+        """
+        chunk_size = self.tokens_per_frame
+        
+        for i in range(0, len(tokens), chunk_size):
+            chunk = tokens[i:i + chunk_size]
+            await asyncio.sleep(self.delay_ms * len(chunk) / 1000.0)
+            yield "".join(chunk)
     
     def _generate_response(self, message: str, system_prompt: Optional[str]) -> str:
         """
@@ -251,27 +469,7 @@ class MockedLLM:
         Returns:
             Generated response string
         """
-        message_lower = message.lower()
-        
-        # Contextual responses based on keywords
-        if "hello" in message_lower or "hi" in message_lower:
-            return "Hello! I'm here to help you. How can I assist you today?"
-        
-        elif "how are you" in message_lower:
-            return "I'm functioning perfectly, thank you for asking! I'm ready to help with any questions or tasks you have."
-        
-        elif "websocket" in message_lower or "realtime" in message_lower:
-            return "WebSockets enable real-time, bidirectional communication between clients and servers. This is perfect for chat applications, live updates, and streaming data like we're doing right now!"
-        
-        elif "fastapi" in message_lower:
-            return "FastAPI is an excellent modern Python web framework. It's fast, supports async/await natively, has automatic API documentation, and makes building WebSocket applications straightforward."
-        
-        elif "supabase" in message_lower or "database" in message_lower:
-            return "Supabase is a fantastic open-source Firebase alternative built on PostgreSQL. It provides real-time subscriptions, authentication, storage, and a powerful database with excellent Python client support."
-        
-        else:
-            # Generic helpful response
-            return f"I understand you're asking about: '{message}'. I'm here to help! Could you provide more details about what you'd like to know?"
+        return _build_response(message, system_prompt)
     
     def _tokenize(self, text: str) -> List[str]:
         """
@@ -283,37 +481,29 @@ class MockedLLM:
         Returns:
             List of tokens
         """
-        tokens = []
-        current_word = ""
-        
-        for char in text:
-            if char in " \n\t":
-                if current_word:
-                    tokens.append(current_word)
-                    current_word = ""
-                tokens.append(char)
-            elif char in ".,!?;:":
-                if current_word:
-                    tokens.append(current_word)
-                    current_word = ""
-                tokens.append(char)
-            else:
-                current_word += char
-        
-        if current_word:
-            tokens.append(current_word)
-        
-        return tokens
+        return _TOKEN_RE.findall(text)
 
 
 # ============================================================================
 # MAIN LLM INTERFACE
 # ============================================================================
 
+# Chunk types yielded by stream_llm_response in (chunk type, content) tuples;
+# TOOL_HISTORY chunks are for conversation history only, not for the client
+TOKEN, TOOL_CALL, TOOL_RESULT, ERROR, TOOL_HISTORY = 0, 1, 2, 3, 4
+
+# Frame "type" name of each chunk type, indexed by chunk type
+CHUNK_TYPE_NAMES = ("token", "tool_call", "tool_result", "error", "tool_history")
+
+# Shared mocked LLM instance, reused across sessions and turns
+_LLM = MockedLLM(delay_ms=30)
+
+
 async def stream_llm_response(
-    messages: List[Dict[str, str]],
-    session_id: str
-) -> AsyncGenerator[Dict[str, Any], None]:
+    messages: Sequence[Dict[str, str]],
+    session_id: str,
+    first_message: Optional[str] = None
+) -> AsyncGenerator[Tuple[int, str], None]:
     """
     Stream LLM response with tool calling support.
     
@@ -324,74 +514,55 @@ async def stream_llm_response(
     - Tool result integration
     
     Args:
-        messages: List of conversation messages with 'role' and 'content'
+        messages: Sequence of conversation messages with 'role' and 'content'
         session_id: Current session identifier
+        first_message: The session's first user message, which decides the
+            conversation mode even once it has left messages
     
     Yields:
-        Dict with 'type' and 'content':
-        - type: "token" (text chunk), "tool_call" (tool execution), "tool_result" (tool output)
+        Tuple of (chunk type, content):
+        - chunk type: TOKEN (text chunk), TOOL_CALL (tool execution),
+          TOOL_RESULT (tool output), TOOL_HISTORY (tool result as recorded
+          in conversation history) or ERROR (tool failure)
         - content: The actual content
     """
-    # Determine conversation mode
-    mode = determine_conversation_mode(messages)
+    # Determine conversation mode and check if we need to call a tool
+    mode, tool_call = _classify(messages, session_id, first_message)
     system_prompt = get_system_prompt(mode)
     
-    # Check if we need to call a tool
-    last_message = messages[-1]["content"] if messages else ""
-    tool_call = detect_tool_call(last_message)
-    
     if tool_call:
         # Yield tool call notification
-        yield {
-            "type": "tool_call",
-            "content": f"🔧 Calling tool: {tool_call['name']}..."
-        }
+        yield TOOL_CALL, f"🔧 Calling tool: {tool_call['name']}..."
         
         # Execute the tool
         try:
             tool_result = await execute_tool(tool_call["name"], tool_call["arguments"])
             
             # Yield tool result
-            yield {
-                "type": "tool_result",
-                "content": json.dumps(tool_result, indent=2)
-            }
+            yield TOOL_RESULT, orjson.dumps(tool_result, option=orjson.OPT_INDENT_2).decode()
             
-            # Add tool result to messages for context
-            messages.append({
-                "role": "tool",
-                "content": f"Tool '{tool_call['name']}' returned: {json.dumps(tool_result)}"
-            })
+            # Add tool result to conversation history for context
+            yield TOOL_HISTORY, f"Tool '{tool_call['name']}' returned: {orjson.dumps(tool_result).decode()}"
             
             # Generate response incorporating tool result
-            llm = MockedLLM(delay_ms=30)
-            
             # Create a contextual message about the tool result
             tool_context = f"Based on the {tool_call['name']} results, here's what I found: "
             
             # Stream the context first
-            for token in tool_context.split():
-                await asyncio.sleep(0.03)
-                yield {"type": "token", "content": token + " "}
+            context_tokens = [token + " " for token in tool_context.split()]
+            async for chunk in _LLM._stream_tokens(context_tokens):
+                yield TOKEN, chunk
             
             # Then stream a summary of the tool result
             summary = f"The data shows {len(tool_result)} key metrics. "
-            for token in summary.split():
-                await asyncio.sleep(0.03)
-                yield {"type": "token", "content": token + " "}
+            summary_tokens = [token + " " for token in summary.split()]
+            async for chunk in _LLM._stream_tokens(summary_tokens):
+                yield TOKEN, chunk
             
         except Exception as e:
-            yield {
-                "type": "error",
-                "content": f"Tool execution failed: {str(e)}"
-            }
+            yield ERROR, f"Tool execution failed: {str(e)}"
     
     else:
         # No tool call needed, just stream normal response
-        llm = MockedLLM(delay_ms=30)
-        
-        async for token in llm.stream_completion(messages, system_prompt):
-            yield {
-                "type": "token",
-                "content": token
-            }
+        async for token in _LLM.stream_completion(messages, system_prompt):
+            yield TOKEN, token
@@ -0,0 +1,63 @@
+"""
+Logging configuration module.
+
+Application loggers (the "app" hierarchy) hand records to a QueueHandler,
+and a QueueListener thread formats and writes them to stderr. Logging a
+message from a coroutine is then just a queue put, so log I/O never blocks
+the event loop.
+"""
+
+import os
+import sys
+import queue
+import logging
+import logging.handlers
+from typing import Optional
+
+# Level of the "app" loggers, e.g. DEBUG to log every message
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Background listener writing queued records; running between start and stop
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_logging() -> None:
+    """
+    Route "app" loggers through a queue to a background writer thread.
+    """
+    global _listener
+    
+    if _listener is not None:
+        return
+    
+    log_queue: queue.Queue = queue.Queue(-1)
+    
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Write all queued records and stop the writer thread.
+    """
+    global _listener
+    
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        
+        logger = logging.getLogger("app")
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                logger.removeHandler(handler)
+        logger.propagate = True
@@ -9,9 +9,16 @@ This module initializes the FastAPI application with:
 - Startup and shutdown events
 """
 
+import asyncio
+import logging
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from app.websocket import handle_websocket
+from app.websocket import handle_websocket, manager, background_tasks
+from app.pool import init_pool, close_pool
+from app.models import event_batcher
+from app.logging_config import start_logging, stop_logging
+
+log = logging.getLogger(__name__)
 
 # Initialize FastAPI application
 app = FastAPI(
@@ -45,12 +52,20 @@ async def startup_event():
     - Loading ML models
     - Starting background tasks
     """
-    print("=" * 60)
-    print("🚀 Realtime AI Backend Starting...")
-    print("=" * 60)
-    print("📡 WebSocket endpoint: ws://localhost:8000/ws/session/{session_id}")
-    print("🏥 Health check: http://localhost:8000/health")
-    print("=" * 60)
+    # Log records are written by a background thread, off the event loop
+    start_logging()
+    
+    # Open the database connection pool before accepting sessions
+    await init_pool()
+    event_batcher.start()
+    
+    log.info("=" * 60)
+    log.info("🚀 Realtime AI Backend Starting...")
+    log.info("=" * 60)
+    log.info("📡 WebSocket endpoint: ws://localhost:8000/ws/session/{session_id}")
+    log.info("🏥 Health check: http://localhost:8000/health")
+    log.info("🔁 Event loop: %s", type(asyncio.get_running_loop()).__module__.split(".")[0])
+    log.info("=" * 60)
 
 
 @app.on_event("shutdown")
@@ -63,9 +78,22 @@ async def shutdown_event():
     - Saving state
     - Cleanup tasks
     """
-    print("=" * 60)
-    print("🛑 Realtime AI Backend Shutting Down...")
-    print("=" * 60)
+    # End sessions still in their resume grace period, write queued events,
+    # let running session summaries finish (they also flush before reading
+    # history), then release pooled database connections
+    manager.end_detached_sessions()
+    await event_batcher.flush()
+    if background_tasks:
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+    await event_batcher.stop()
+    await close_pool()
+    
+    log.info("=" * 60)
+    log.info("🛑 Realtime AI Backend Shutting Down...")
+    log.info("=" * 60)
+    
+    # Flush queued log records last
+    stop_logging()
 
 
 # ============================================================================
@@ -153,7 +181,7 @@ async def global_exception_handler(request, exc):
     Returns:
         Dict with error details
     """
-    print(f"[Error] Unhandled exception: {exc}")
+    log.error("[Error] Unhandled exception: %s", exc)
     return {
         "error": "Internal server error",
         "detail": str(exc)
@@ -165,8 +193,13 @@ async def global_exception_handler(request, exc):
 # ============================================================================
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
     
+    # Require uvloop wherever it is installed (uvicorn[standard] on
+    # Linux/macOS); Windows has no uvloop build and runs on asyncio
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    
     # Run the application
     # Use --reload flag for development (auto-restart on code changes)
     uvicorn.run(
@@ -174,5 +207,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        loop=loop
     )
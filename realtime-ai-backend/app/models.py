@@ -6,14 +6,107 @@ This module provides async functions for all database operations including:
 - Inserting events (user messages, AI responses, tool calls)
 - Fetching conversation history
 - Updating session summaries
+
+All queries run on the asyncpg connection pool from app.pool, as the
+STATEMENTS text that asyncpg prepares once per connection. Events are written in micro-batches by the EventBatcher from
+app.batcher instead of one round-trip per event.
 """
 
-import asyncio
-from datetime import datetime
-from typing import List, Dict, Any, Optional
-from app.db import get_supabase_client
+import logging
+import time
+from typing import List, Dict, Any, Optional, Tuple
+import asyncpg
+from app.pool import get_pool, STATEMENTS
+from app.batcher import EventBatcher
+
+log = logging.getLogger(__name__)
+
+
+# ============================================================================
+# EVENT MICRO-BATCHING
+# ============================================================================
+
+async def _write_events(batch: List[Tuple[str, str, str, float]]) -> None:
+    """
+    Write a batch of queued events in a single round-trip.
+    
+    The batch insert is atomic, so if the database rejects it (e.g. a
+    foreign key violation for a session whose row was never created) the
+    events are retried per session, and a rejected session's events one by
+    one. Only the offending events are dropped, not the rest of the batch.
+    
+    Args:
+        batch: Queued (session_id, role, content, epoch seconds) tuples
+    
+    Raises:
+        Exception: If the events cannot be written at all (e.g. no connection)
+    """
+    try:
+        async with (await get_pool()).acquire() as con:
+            try:
+                await con.executemany(STATEMENTS["insert_events"], batch)
+            except asyncpg.PostgresError as e:
+                log.warning(
+                    "Error inserting %d event(s), retrying per session: %s", len(batch), e
+                )
+                await _write_events_per_session(con, batch)
+    
+    except Exception as e:
+        log.error("Error inserting %d event(s): %s", len(batch), e)
+        raise
+
+
+async def _write_events_per_session(
+    con: asyncpg.Connection,
+    batch: List[Tuple[str, str, str, float]]
+) -> None:
+    """
+    Write a rejected batch again, one session's events at a time.
+    
+    A session whose events are rejected again has them retried one event
+    at a time, so e.g. one message the database cannot store (such as a
+    NUL character in the content) does not take the session's other
+    events with it.
+    
+    Args:
+        con: Connection the batch was rejected on
+        batch: Queued (session_id, role, content, epoch seconds) tuples
+    """
+    by_session: Dict[str, List[Tuple[str, str, str, float]]] = {}
+    for event in batch:
+        by_session.setdefault(event[0], []).append(event)
+    
+    for session_id, events in by_session.items():
+        try:
+            await con.executemany(STATEMENTS["insert_events"], events)
+        except asyncpg.PostgresError:
+            for event in events:
+                try:
+                    await con.execute(STATEMENTS["insert_events"], *event)
+                except asyncpg.PostgresError as e:
+                    log.error(
+                        "Dropping %s event of session %s: %s", event[1], session_id, e
+                    )
+
+
+# Batching writer for events; started and stopped with the application
+event_batcher = EventBatcher(
+    _write_events,
+    batch_size=200,
+    flush_interval_ms=20,
+    maxsize=10000
+)
+
+# Rows of sessions created by this process: session_id -> session data.
+# start_time never changes during a session, so get_session can answer
+# from here until the session's end processing is done.
+_SESSION_CACHE: Dict[str, Dict[str, Any]] = {}
 
 
+# ============================================================================
+# SESSION AND EVENT HELPERS
+# ============================================================================
+
 async def create_session(session_id: str, user_id: str = "anonymous") -> Dict[str, Any]:
     """
     Create a new session in the database.
@@ -29,23 +122,17 @@ async def create_session(session_id: str, user_id: str = "anonymous") -> Dict[st
         Exception: If session creation fails
     """
     try:
-        supabase = get_supabase_client()
+        async with (await get_pool()).acquire() as con:
+            row = await con.fetchrow(STATEMENTS["create_session"], session_id, user_id)
         
-        # Run the blocking Supabase call in a thread pool to keep it async
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            lambda: supabase.table("sessions").insert({
-                "session_id": session_id,
-                "user_id": user_id,
-                "start_time": datetime.utcnow().isoformat()
-            }).execute()
-        )
+        session = dict(row) if row else {}
+        if session:
+            _SESSION_CACHE[session_id] = session
         
-        return result.data[0] if result.data else {}
+        return session
     
     except Exception as e:
-        print(f"Error creating session: {e}")
+        log.error("Error creating session: %s", e)
         raise
 
 
@@ -53,40 +140,32 @@ async def insert_event(
     session_id: str,
     role: str,
     content: str
-) -> Dict[str, Any]:
+) -> None:
     """
-    Insert an event (message) into the database.
+    Queue an event (message) for insertion into the database.
+    
+    Returns immediately unless the event queue is full; the event batcher
+    writes queued events in batches.
     
     Args:
         session_id: Session identifier
         role: Role of the message sender ("user", "assistant", or "tool")
         content: Message content
     
-    Returns:
-        Dict containing the created event data
-    
     Raises:
-        Exception: If event insertion fails
+        RuntimeError: If the event batcher is not running
     """
-    try:
-        supabase = get_supabase_client()
-        
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            lambda: supabase.table("events").insert({
-                "session_id": session_id,
-                "role": role,
-                "content": content,
-                "timestamp": datetime.utcnow().isoformat()
-            }).execute()
-        )
-        
-        return result.data[0] if result.data else {}
+    await event_batcher.put((session_id, role, content, time.time()))
+
+
+async def flush_events() -> None:
+    """
+    Wait until all events queued so far have been written.
     
-    except Exception as e:
-        print(f"Error inserting event: {e}")
-        raise
+    Call before reading events back, so the latest ones are not missed
+    while they wait in the event batcher.
+    """
+    await event_batcher.flush()
 
 
 async def get_session_history(session_id: str) -> List[Dict[str, Any]]:
@@ -103,29 +182,21 @@ async def get_session_history(session_id: str) -> List[Dict[str, Any]]:
         Exception: If fetching history fails
     """
     try:
-        supabase = get_supabase_client()
-        
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            lambda: supabase.table("events")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .order("timestamp")\
-                .execute()
-        )
+        async with (await get_pool()).acquire() as con:
+            rows = await con.fetch(STATEMENTS["get_session_history"], session_id)
         
-        return result.data if result.data else []
+        return [dict(row) for row in rows]
     
     except Exception as e:
-        print(f"Error fetching session history: {e}")
+        log.error("Error fetching session history: %s", e)
         raise
 
 
 async def update_session_summary(
     session_id: str,
     summary: str,
-    duration: int
+    duration: int,
+    end_time: float
 ) -> Dict[str, Any]:
     """
     Update session with end time, duration, and summary.
@@ -134,6 +205,7 @@ async def update_session_summary(
         session_id: Session identifier
         summary: Generated summary of the conversation
         duration: Session duration in seconds
+        end_time: When the session ended, in epoch seconds
     
     Returns:
         Dict containing the updated session data
@@ -141,26 +213,19 @@ async def update_session_summary(
     Raises:
         Exception: If update fails
     """
+    # The session is over; drop its cached row
+    _SESSION_CACHE.pop(session_id, None)
+    
     try:
-        supabase = get_supabase_client()
-        
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            lambda: supabase.table("sessions")\
-                .update({
-                    "end_time": datetime.utcnow().isoformat(),
-                    "duration": duration,
-                    "final_summary": summary
-                })\
-                .eq("session_id", session_id)\
-                .execute()
-        )
+        async with (await get_pool()).acquire() as con:
+            row = await con.fetchrow(
+                STATEMENTS["update_session_summary"], session_id, duration, summary, end_time
+            )
         
-        return result.data[0] if result.data else {}
+        return dict(row) if row else {}
     
     except Exception as e:
-        print(f"Error updating session summary: {e}")
+        log.error("Error updating session summary: %s", e)
         raise
 
 
@@ -174,20 +239,26 @@ async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         Dict containing session data or None if not found
     """
+    session = _SESSION_CACHE.get(session_id)
+    if session is not None:
+        return session
+    
     try:
-        supabase = get_supabase_client()
-        
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            lambda: supabase.table("sessions")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .execute()
-        )
+        async with (await get_pool()).acquire() as con:
+            row = await con.fetchrow(STATEMENTS["get_session"], session_id)
         
-        return result.data[0] if result.data else None
+        return dict(row) if row else None
     
     except Exception as e:
-        print(f"Error fetching session: {e}")
+        log.error("Error fetching session: %s", e)
         return None
+
+
+def forget_cached_session(session_id: str) -> None:
+    """
+    Drop the cached row of a session whose end processing is done.
+    
+    Args:
+        session_id: Session identifier
+    """
+    _SESSION_CACHE.pop(session_id, None)
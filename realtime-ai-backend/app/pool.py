@@ -0,0 +1,106 @@
+"""
+Database connection pool module.
+
+This module owns the asyncpg connection pool used for all database operations.
+Connections go straight to the Supabase Postgres endpoint and are kept warm
+between queries, so database calls never leave the event loop. The hot
+queries are always sent as the same STATEMENTS text, so asyncpg's
+per-connection statement cache prepares each one once per connection and
+reuses it; their parse/plan cost is not paid on every call.
+"""
+
+import os
+from typing import Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Direct Postgres connection string of the Supabase project
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
+
+# Pool bounds; the maximum caps concurrent server connections (and their
+# lock and CPU load on Postgres) however many sessions are active
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# Hot queries; asyncpg caches their prepared statements per connection
+STATEMENTS = {
+    "create_session": (
+        "INSERT INTO sessions(session_id, user_id, start_time) "
+        "VALUES($1, $2, now()) RETURNING *"
+    ),
+    "insert_events": (
+        "INSERT INTO events(session_id, role, content, timestamp) "
+        "VALUES($1, $2, $3, to_timestamp($4))"
+    ),
+    "get_session_history": (
+        "SELECT * FROM events WHERE session_id = $1 ORDER BY timestamp"
+    ),
+    "update_session_summary": (
+        "UPDATE sessions SET end_time = to_timestamp($4), duration = $2, final_summary = $3 "
+        "WHERE session_id = $1 RETURNING *"
+    ),
+    "get_session": (
+        "SELECT * FROM sessions WHERE session_id = $1"
+    ),
+}
+
+# Module-level pool, created on application startup
+_pool: Optional[asyncpg.Pool] = None
+
+
+async def init_pool() -> asyncpg.Pool:
+    """
+    Create the connection pool if it does not exist yet.
+    
+    Returns:
+        asyncpg.Pool: The initialized connection pool
+    
+    Raises:
+        ValueError: If SUPABASE_DB_URL is not configured
+    """
+    global _pool
+    
+    if _pool is None:
+        if not SUPABASE_DB_URL:
+            raise ValueError(
+                "Missing database connection string. Please set SUPABASE_DB_URL "
+                "in your .env file. See .env.example for reference."
+            )
+        
+        _pool = await asyncpg.create_pool(
+            dsn=SUPABASE_DB_URL,
+            min_size=DB_POOL_MIN,
+            max_size=DB_POOL_MAX,
+            max_inactive_connection_lifetime=300,
+            command_timeout=60
+        )
+    
+    return _pool
+
+
+async def get_pool() -> asyncpg.Pool:
+    """
+    Get the connection pool, creating it on first use.
+    
+    Returns:
+        asyncpg.Pool: The initialized connection pool
+    """
+    if _pool is None:
+        return await init_pool()
+    
+    return _pool
+
+
+async def close_pool() -> None:
+    """
+    Close all pooled connections.
+    """
+    global _pool
+    
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -9,9 +9,28 @@ This module handles background tasks that run after a WebSocket session ends:
 """
 
 import asyncio
-from datetime import datetime
-from typing import List, Dict, Any
-from app.models import get_session_history, update_session_summary, get_session
+import logging
+import time
+from typing import List, Dict, Any, Optional
+from app.models import (
+    get_session_history, update_session_summary, get_session, flush_events,
+    forget_cached_session
+)
+from app.keywords import build_keyword_automaton, match_keyword_groups
+
+log = logging.getLogger(__name__)
+
+
+# Topic keywords, in the order topics are reported
+TOPIC_KEYWORDS = {
+    "WebSockets": ["websocket", "realtime"],
+    "FastAPI": ["fastapi", "api"],
+    "Supabase": ["supabase", "database"],
+    "Data Retrieval": ["data", "fetch", "stats"],
+}
+
+# All topic keywords compiled once at import
+TOPIC_AUTOMATON = build_keyword_automaton(TOPIC_KEYWORDS)
 
 
 async def generate_session_summary(messages: List[Dict[str, Any]]) -> str:
@@ -27,34 +46,37 @@ async def generate_session_summary(messages: List[Dict[str, Any]]) -> str:
     if not messages:
         return "No conversation occurred in this session."
     
-    # Count messages by role
-    user_messages = [m for m in messages if m["role"] == "user"]
-    assistant_messages = [m for m in messages if m["role"] == "assistant"]
-    tool_calls = [m for m in messages if m["role"] == "tool"]
+    # Count messages by role and extract key topics in a single pass
+    user_count = assistant_count = tool_count = 0
+    topics: List[str] = []
     
-    # Extract key topics from user messages
-    topics = []
-    for msg in user_messages[:3]:  # First 3 messages for context
-        content = msg["content"].lower()
-        if "websocket" in content or "realtime" in content:
-            topics.append("WebSockets")
-        if "fastapi" in content or "api" in content:
-            topics.append("FastAPI")
-        if "supabase" in content or "database" in content:
-            topics.append("Supabase")
-        if "data" in content or "fetch" in content or "stats" in content:
-            topics.append("Data Retrieval")
-    
-    # Remove duplicates while preserving order
-    topics = list(dict.fromkeys(topics))
+    for msg in messages:
+        role = msg["role"]
+        
+        if role == "user":
+            user_count += 1
+            
+            # First 3 user messages for context; topics in first-seen order
+            if user_count <= 3:
+                hits = match_keyword_groups(TOPIC_AUTOMATON, msg["content"].casefold())
+                topics.extend(
+                    topic for topic in TOPIC_KEYWORDS
+                    if topic in hits and topic not in topics
+                )
+        
+        elif role == "assistant":
+            assistant_count += 1
+        
+        elif role == "tool":
+            tool_count += 1
     
     # Build summary
     summary_parts = [
-        f"Session with {len(user_messages)} user message(s) and {len(assistant_messages)} AI response(s)."
+        f"Session with {user_count} user message(s) and {assistant_count} AI response(s)."
     ]
     
-    if tool_calls:
-        summary_parts.append(f"Used {len(tool_calls)} tool call(s) for data retrieval.")
+    if tool_count:
+        summary_parts.append(f"Used {tool_count} tool call(s) for data retrieval.")
     
     if topics:
         summary_parts.append(f"Topics discussed: {', '.join(topics)}.")
@@ -64,7 +86,7 @@ async def generate_session_summary(messages: List[Dict[str, Any]]) -> str:
     return " ".join(summary_parts)
 
 
-async def process_session_end(session_id: str) -> None:
+async def process_session_end(session_id: str, ended_at: Optional[float] = None) -> None:
     """
     Process session end: generate summary and update database.
     
@@ -72,38 +94,50 @@ async def process_session_end(session_id: str) -> None:
     
     Args:
         session_id: Session identifier
+        ended_at: When the session's connection closed, in epoch seconds;
+            defaults to now. Processing may start later (e.g. after the
+            resume grace period), which must not count towards the session.
     """
+    if ended_at is None:
+        ended_at = time.time()
+    
     try:
-        print(f"[Background Task] Processing session end for: {session_id}")
+        log.debug("[Background Task] Processing session end for: %s", session_id)
+        
+        # The session's last events may still be waiting in the batcher
+        await flush_events()
+        
+        # Fetch session data (for start time) and conversation history concurrently
+        session, messages = await asyncio.gather(
+            get_session(session_id),
+            get_session_history(session_id)
+        )
         
-        # Fetch session data to get start time
-        session = await get_session(session_id)
         if not session:
-            print(f"[Background Task] Session {session_id} not found")
+            log.warning("[Background Task] Session %s not found", session_id)
             return
         
-        # Fetch conversation history
-        messages = await get_session_history(session_id)
-        
         if not messages:
-            print(f"[Background Task] No messages found for session {session_id}")
+            log.info("[Background Task] No messages found for session %s", session_id)
             summary = "Empty session - no messages exchanged."
             duration = 0
         else:
             # Generate summary
             summary = await generate_session_summary(messages)
             
-            # Calculate duration
-            start_time = datetime.fromisoformat(session["start_time"].replace("Z", "+00:00"))
-            end_time = datetime.utcnow()
-            duration = int((end_time - start_time).total_seconds())
+            # Calculate duration from epoch seconds; no datetime arithmetic needed
+            duration = int(ended_at - session["start_time"].timestamp())
         
         # Update session in database
-        await update_session_summary(session_id, summary, duration)
+        await update_session_summary(session_id, summary, duration, ended_at)
         
-        print(f"[Background Task] Session {session_id} processed successfully")
-        print(f"[Background Task] Summary: {summary}")
-        print(f"[Background Task] Duration: {duration}s")
+        log.info("[Background Task] Session %s processed successfully", session_id)
+        log.debug("[Background Task] Summary: %s", summary)
+        log.debug("[Background Task] Duration: %ss", duration)
     
     except Exception as e:
-        print(f"[Background Task] Error processing session {session_id}: {e}")
+        log.error("[Background Task] Error processing session %s: %s", session_id, e)
+    
+    finally:
+        # Also on early return or failure, so the cache cannot grow unbounded
+        forget_cached_session(session_id)
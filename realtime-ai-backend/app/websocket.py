@@ -6,98 +6,603 @@ This module manages WebSocket connections and handles real-time communication:
 - Receives user messages
 - Streams AI responses token-by-token
 - Persists all events to database asynchronously
-- Maintains conversation state across multiple messages
-- Triggers post-session processing on disconnect
+- Maintains conversation state across multiple messages and reconnects
+- Triggers post-session processing once a disconnected session's resume
+  grace period is over
 """
 
-import json
+import os
+import time
 import asyncio
-from typing import Dict, List
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import orjson
+import msgspec
 from fastapi import WebSocket, WebSocketDisconnect
 from app.models import create_session, insert_event
-from app.llm import stream_llm_response
+from app.llm import (
+    stream_llm_response, forget_session,
+    TOKEN, TOOL_RESULT, TOOL_HISTORY, CHUNK_TYPE_NAMES
+)
 from app.summary import process_session_end
 
+log = logging.getLogger(__name__)
+
+
+# Session state bounds: at most MAX_SESSIONS sessions are kept in memory
+# (least recently used evicted first), each with at most CTX_TURNS messages
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+CTX_TURNS = int(os.getenv("CTX_TURNS", "40"))
+
+# Admission control: sessions allowed to run concurrently
+MAX_WS_SESSIONS = int(os.getenv("MAX_WS_SESSIONS", "500"))
+_admission = asyncio.Semaphore(MAX_WS_SESSIONS)
+
+# Token coalescing: buffered tokens are sent as one frame once this many
+# have accumulated, or once this long (seconds) has passed since the last frame
+TOKEN_FLUSH_COUNT = 16
+TOKEN_FLUSH_INTERVAL = 0.015
+
+# Outbound frames queued per session before token frames are coalesced
+OUTBOX_SIZE = 256
+
+# Sent frames kept per session for replay on a resume request
+RESUME_FRAMES = 128
+
+# Seconds a session outlives its connection, so a reconnecting client can
+# resume it; the session is summarized once this passes
+RESUME_GRACE = float(os.getenv("RESUME_GRACE_SECONDS", "30"))
+
+# Post-session tasks still running; holding a reference keeps them from being
+# garbage-collected mid-flight, and shutdown waits for them
+background_tasks: Set[asyncio.Task] = set()
+
+# Invariant frames, encoded once at import time
+END_FRAME = orjson.dumps({"type": "end", "content": ""})
+EMPTY_ERR = orjson.dumps({"type": "error", "content": "Empty message received"})
+INVALID_JSON = orjson.dumps({"type": "error", "content": "Invalid JSON format"})
+
+# Marker telling the client that frames were coalesced for a slow connection
+BACKPRESSURE_FRAME = orjson.dumps({"type": "backpressure", "content": ""})
+
+
+class InMsg(msgspec.Struct):
+    """
+    Inbound client message.
+    
+    Attributes:
+        message: User message text; empty for control messages
+        type: Control message type, e.g. "resume"
+        resume_from: First seq to resend for a resume request ("from" on the wire)
+    """
+    
+    message: str = ""
+    type: str = ""
+    resume_from: int = msgspec.field(default=0, name="from")
+
+
+# Inbound messages are decoded straight into InMsg; the schema is compiled once
+_decode_message = msgspec.json.Decoder(InMsg).decode
+
+# Fast rejection before decoding: shorter frames cannot carry a message, and a
+# frame without one of these substrings is neither a message nor a resume
+# request. Binary frames arrive as bytes and text frames as str.
+_MIN_MESSAGE_LEN = len('{"message":"a"}')
+_MESSAGE_MARKERS = {
+    bytes: (b'"message"', b'"resume"'),
+    str: ('"message"', '"resume"'),
+}
+
+# Encoded frame envelope up to the content value, indexed by chunk type.
+# Only the content varies, so a frame is prefix + encoded string + suffix.
+_FRAME_PREFIXES = tuple(
+    orjson.dumps({"type": frame_type, "content": ""})[:-3]
+    for frame_type in CHUNK_TYPE_NAMES
+)
+_FRAME_SUFFIX = b"}"
+_TOKEN_FRAME_PREFIX = _FRAME_PREFIXES[TOKEN]
+
+
+def _encode_frame(chunk_type: int, content: str) -> bytes:
+    """
+    Encode a streamed chunk as a frame from its precomputed envelope.
+    
+    Args:
+        chunk_type: Chunk type from app.llm (TOKEN, TOOL_CALL, ...)
+        content: Chunk content
+    
+    Returns:
+        Encoded frame, byte-identical to orjson.dumps of the frame dict
+    """
+    return _FRAME_PREFIXES[chunk_type] + orjson.dumps(content) + _FRAME_SUFFIX
+
+
+def _encode_tokens(tokens: List[str]) -> bytes:
+    """
+    Encode token strings as a single token frame.
+    
+    Args:
+        tokens: Token strings, in order
+    
+    Returns:
+        Encoded token frame
+    """
+    return _TOKEN_FRAME_PREFIX + orjson.dumps("".join(tokens)) + _FRAME_SUFFIX
+
+
+class SessionState:
+    """
+    In-memory state of a single session, kept across reconnects.
+    
+    A session outlives its connections: once its connection closes it is
+    kept for RESUME_GRACE seconds, and a client reconnecting with the same
+    session_id in that time continues it, history and frame numbering
+    included. Every outbound frame is stamped with the next "seq" and the
+    last RESUME_FRAMES stamped frames are kept. That includes frames that
+    were queued but never delivered, so a reconnecting client can ask for
+    what it missed.
+    
+    Frames of a turn go to whichever connection is current when they are
+    sent, so a reply that was streaming when the client reconnected
+    continues on the new connection. Turns run one at a time under the
+    session's turn lock, so a turn begun on a replaced connection finishes
+    before the new connection's first turn starts.
+    
+    Attributes:
+        history: Recent conversation messages, oldest dropped past CTX_TURNS
+        opening: The session's first user message, kept after it leaves
+            history since it decides the conversation mode
+        next_seq: Sequence number of the next outbound frame
+        sent: Recently stamped (seq, frame) pairs
+        connection: The session's open connection, if any
+        expiry: Timer ending the session once its grace period is over
+        disconnected_at: When the last connection closed (epoch seconds),
+            while the session has none; this is when the session ended if
+            the client does not come back
+        turn: Lock held while a message is answered
+    """
+    
+    __slots__ = (
+        "history", "opening", "next_seq", "sent", "connection", "expiry", "disconnected_at",
+        "turn",
+    )
+    
+    def __init__(self):
+        self.history: Deque[Dict[str, str]] = deque(maxlen=CTX_TURNS)
+        self.opening: Optional[str] = None
+        self.next_seq = 0
+        self.sent: Deque[Tuple[int, bytes]] = deque(maxlen=RESUME_FRAMES)
+        self.connection: Optional["Connection"] = None
+        self.expiry: Optional[asyncio.TimerHandle] = None
+        self.disconnected_at: Optional[float] = None
+        self.turn = asyncio.Lock()
+    
+    def stamp(self, frame: bytes) -> bytes:
+        """
+        Number a frame and retain it for replay.
+        
+        The seq is spliced in before the frame's closing brace, so the
+        frame is not re-encoded.
+        
+        Args:
+            frame: Encoded JSON frame without a seq
+        
+        Returns:
+            The frame with its "seq" field
+        """
+        seq = self.next_seq
+        self.next_seq += 1
+        frame = b"%s,\"seq\":%d}" % (frame[:-1], seq)
+        self.sent.append((seq, frame))
+        return frame
+    
+    async def send(self, frame: bytes) -> None:
+        """
+        Queue a frame on the session's current connection.
+        
+        Without a connection (during the grace period) the frame is only
+        stamped and retained for a resume.
+        
+        Args:
+            frame: Encoded JSON frame without a seq
+        """
+        connection = self.connection
+        if connection is None:
+            self.stamp(frame)
+        else:
+            await connection.send(frame)
+
+
+class Connection:
+    """
+    One WebSocket connection of a session.
+    
+    Outbound frames go through a bounded outbox drained by a dedicated
+    sender task, so a slow client cannot make pending frames grow without
+    bound.
+    
+    Attributes:
+        websocket: The WebSocket connection
+        session: State of the session this connection belongs to
+        outbox: (encoded frame, already stamped) pairs waiting to be sent
+        sender: Task sending outbox frames to the client
+        closed: Whether the connection is gone; further frames are only
+            stamped and retained for a resume
+        backpressured: Whether a backpressure marker was queued since the
+            outbox last drained
+        first_seq: Session seq when the connection opened; later frames
+            are this connection's own and are never replayed on it
+    """
+    
+    __slots__ = (
+        "websocket", "session", "outbox", "sender", "closed", "backpressured", "first_seq",
+    )
+    
+    def __init__(self, websocket: WebSocket, session: SessionState):
+        self.websocket = websocket
+        self.session = session
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        self.sender: Optional[asyncio.Task] = None
+        self.closed = False
+        self.backpressured = False
+        self.first_seq = session.next_seq
+    
+    def start(self) -> None:
+        """
+        Start the sender task.
+        """
+        if self.sender is None:
+            self.sender = asyncio.create_task(self._send_loop())
+    
+    def stop(self) -> None:
+        """
+        Cancel the sender task.
+        
+        Frames still queued are stamped and retained rather than lost, so
+        a client resuming on a new connection can get them.
+        """
+        self.closed = True
+        if self.sender is not None:
+            self.sender.cancel()
+            self.sender = None
+        
+        # Emptying the outbox releases any producer waiting for room
+        self._drain()
+    
+    async def send(self, frame: bytes) -> None:
+        """
+        Queue an encoded frame for sending.
+        
+        When the outbox is full, pending token frames are merged into one
+        and, once per backpressure episode, a backpressure marker is queued.
+        Only if that frees no room does the caller wait for the sender.
+        
+        Args:
+            frame: Encoded JSON frame
+        """
+        if self.closed:
+            self.session.stamp(frame)
+            return
+        
+        try:
+            self.outbox.put_nowait((frame, False))
+            return
+        except asyncio.QueueFull:
+            pass
+        
+        self._coalesce()
+        await self.outbox.put((frame, False))
+        
+        # stop() may have emptied the outbox to let this put through; the
+        # frame then landed in a dead outbox and is retained from there
+        if self.closed:
+            self._drain()
+    
+    async def replay(self, from_seq: int) -> None:
+        """
+        Queue retained frames from earlier connections for resending.
+        
+        Frames numbered from_seq up to this connection's first_seq are
+        resent as originally stamped; frames from first_seq on are already
+        being sent here. Frames older than the retained window are gone; the
+        client sees that from the first replayed seq.
+        
+        Args:
+            from_seq: First sequence number the client is missing
+        """
+        for seq, frame in list(self.session.sent):
+            if from_seq <= seq < self.first_seq and not self.closed:
+                await self.outbox.put((frame, True))
+    
+    def _drain(self) -> None:
+        """
+        Empty the outbox of a closed connection, stamping and retaining
+        frames that were never sent.
+        """
+        while not self.outbox.empty():
+            frame, stamped = self.outbox.get_nowait()
+            if not stamped:
+                self.session.stamp(frame)
+    
+    def _coalesce(self) -> None:
+        """
+        Merge runs of queued token frames into single frames.
+        
+        Frame order is kept; only adjacent token frames are merged, so no
+        token moves past a tool or end frame. Replayed frames already carry
+        their seq and are left as they are.
+        
+        A backpressure marker is queued after the merged frames when an
+        episode starts (the outbox has not drained since the last marker was
+        queued). A marker still queued from earlier in the episode is moved
+        there instead, so markers never split token runs or pile up.
+        """
+        items: List[Tuple[bytes, bool]] = []
+        while True:
+            try:
+                items.append(self.outbox.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        
+        merged: List[Tuple[bytes, bool]] = []
+        tokens: List[str] = []
+        marker_queued = False
+        for frame, stamped in items:
+            if not stamped and frame is BACKPRESSURE_FRAME:
+                marker_queued = True
+                continue
+            
+            if not stamped and frame.startswith(_TOKEN_FRAME_PREFIX):
+                tokens.append(orjson.loads(frame)["content"])
+                continue
+            
+            if tokens:
+                merged.append((_encode_tokens(tokens), False))
+                tokens.clear()
+            merged.append((frame, stamped))
+        
+        if tokens:
+            merged.append((_encode_tokens(tokens), False))
+        
+        # Tell the client once per episode that frames were merged
+        if marker_queued or (len(merged) < len(items) and not self.backpressured):
+            merged.append((BACKPRESSURE_FRAME, False))
+            self.backpressured = True
+        
+        for item in merged:
+            self.outbox.put_nowait(item)
+    
+    async def _send_loop(self) -> None:
+        """
+        Send queued frames until cancelled.
+        
+        New frames are stamped with the session's next seq as they are
+        sent. A failed send marks the connection closed; frames queued
+        afterwards are stamped and retained but not sent, so producers never
+        wait on a dead connection.
+        """
+        while True:
+            frame, stamped = await self.outbox.get()
+            if not stamped:
+                frame = self.session.stamp(frame)
+            if self.closed:
+                continue
+            
+            try:
+                await self.websocket.send_bytes(frame)
+            except Exception as e:
+                log.warning("[WebSocket] Error sending frame: %s", e)
+                self.closed = True
+            
+            # The client has caught up; the next backpressure is a new episode
+            if self.outbox.empty():
+                self.backpressured = False
+
 
 class ConnectionManager:
     """
     Manages WebSocket connections and conversation state.
     
     Each session maintains its own conversation history in memory
-    for context management during the session.
+    for context management during the session. Sessions are kept in
+    least-recently-used order and bounded by MAX_SESSIONS.
     """
     
     def __init__(self):
-        # Active connections: session_id -> WebSocket
-        self.active_connections: Dict[str, WebSocket] = {}
-        
-        # Conversation history: session_id -> List[messages]
-        self.conversation_history: Dict[str, List[Dict[str, str]]] = {}
+        # Session state in LRU order, including sessions in their resume
+        # grace period: session_id -> SessionState
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
     
-    async def connect(self, websocket: WebSocket, session_id: str):
+    async def connect(self, websocket: WebSocket, session_id: str) -> Connection:
         """
         Accept WebSocket connection and initialize session.
         
+        If the session_id is still tracked, the connection continues that
+        session. This covers a reconnect within the grace period and the
+        case where the old connection is still open, which is then stopped
+        and closed; a reply it was streaming continues on the new
+        connection. Evicts and closes the least recently used sessions when
+        MAX_SESSIONS is exceeded.
+        
         Args:
             websocket: WebSocket connection
             session_id: Unique session identifier
+        
+        Returns:
+            The new connection, with its sender task running
         """
         await websocket.accept()
-        self.active_connections[session_id] = websocket
-        self.conversation_history[session_id] = []
         
-        print(f"[WebSocket] Client connected: {session_id}")
+        state = self.sessions.get(session_id)
+        resumed = state is not None
+        if state is None:
+            state = SessionState()
+            self.sessions[session_id] = state
+        else:
+            if state.expiry is not None:
+                state.expiry.cancel()
+                state.expiry = None
+            state.disconnected_at = None
+            
+            replaced = state.connection
+            if replaced is not None:
+                log.info("[WebSocket] Replacing existing connection for session: %s", session_id)
+                replaced.stop()
+                try:
+                    await replaced.websocket.close(code=1000)
+                except Exception as e:
+                    log.warning("[WebSocket] Error closing replaced connection %s: %s", session_id, e)
+        
+        connection = Connection(websocket, state)
+        connection.start()
+        state.connection = connection
+        self.sessions.move_to_end(session_id)
         
-        # Create session in database
-        try:
-            await create_session(session_id)
-            print(f"[Database] Session created: {session_id}")
-        except Exception as e:
-            print(f"[Database] Error creating session {session_id}: {e}")
+        log.info(
+            "[WebSocket] Client %s: %s", "reconnected" if resumed else "connected", session_id
+        )
+        
+        while len(self.sessions) > MAX_SESSIONS:
+            evicted_id, evicted = self.sessions.popitem(last=False)
+            log.info("[WebSocket] Evicting least recently used session: %s", evicted_id)
+            if evicted.expiry is not None:
+                evicted.expiry.cancel()
+            if evicted.connection is not None:
+                evicted.connection.stop()
+                try:
+                    await evicted.connection.websocket.close(code=1001)
+                except Exception as e:
+                    log.warning("[WebSocket] Error closing evicted session %s: %s", evicted_id, e)
+            
+            # The evicted handler's disconnect() no longer sees it as current
+            self._end_session(evicted_id, evicted)
+        
+        # Create session in database; a continued session already has one
+        if not resumed:
+            try:
+                await create_session(session_id)
+                log.debug("[Database] Session created: %s", session_id)
+            except Exception as e:
+                log.error("[Database] Error creating session %s: %s", session_id, e)
+        
+        return connection
     
-    async def disconnect(self, session_id: str):
+    async def disconnect(self, session_id: str, connection: Connection):
         """
         Handle WebSocket disconnect and cleanup.
         
+        The session is kept for RESUME_GRACE seconds so the client can
+        reconnect and resume; it ends (and is summarized) once that passes.
+        A connection that was replaced by a newer one, or whose session was
+        evicted, leaves the session untouched.
+        
         Args:
             session_id: Session identifier
+            connection: Connection returned by connect() for this handler
         """
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
+        connection.stop()
+        
+        state = connection.session
+        if state.connection is not connection or self.sessions.get(session_id) is not state:
+            log.debug("[WebSocket] Replaced connection closed: %s", session_id)
+            return
         
-        if session_id in self.conversation_history:
-            del self.conversation_history[session_id]
+        state.connection = None
+        state.disconnected_at = time.time()
         
-        print(f"[WebSocket] Client disconnected: {session_id}")
+        log.info("[WebSocket] Client disconnected: %s", session_id)
+        
+        state.expiry = asyncio.get_running_loop().call_later(
+            RESUME_GRACE, self._expire, session_id, state
+        )
+    
+    def end_detached_sessions(self) -> None:
+        """
+        End every session waiting out its grace period, e.g. on shutdown.
+        """
+        for session_id, state in list(self.sessions.items()):
+            if state.connection is None:
+                self._expire(session_id, state)
+    
+    def _expire(self, session_id: str, state: SessionState) -> None:
+        """
+        End a session whose connection closed and did not come back.
+        
+        Args:
+            session_id: Session identifier
+            state: The session's state when its connection closed
+        """
+        if self.sessions.get(session_id) is not state or state.connection is not None:
+            return
+        
+        if state.expiry is not None:
+            state.expiry.cancel()
+            state.expiry = None
+        del self.sessions[session_id]
+        
+        self._end_session(session_id, state)
+    
+    def _end_session(self, session_id: str, state: SessionState) -> None:
+        """
+        Drop per-session LLM state and start post-session processing.
+        
+        The session ended when its last connection closed, not when the
+        grace period ran out; a session evicted while connected ends now.
+        
+        Args:
+            session_id: Session identifier
+            state: The session's state
+        """
+        forget_session(session_id)
+        
+        ended_at = state.disconnected_at or time.time()
         
         # Trigger background task for session summary
-        asyncio.create_task(process_session_end(session_id))
+        task = asyncio.create_task(process_session_end(session_id, ended_at))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
     
-    def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
+    def get_conversation_history(self, session_id: str) -> Tuple[Dict[str, str], ...]:
         """
-        Get conversation history for a session.
+        Get a snapshot of the conversation history for a session.
+        
+        The snapshot is immutable, so later add_message calls never change
+        what a caller (such as an in-flight LLM stream) is holding.
         
         Args:
             session_id: Session identifier
         
         Returns:
-            List of messages with role and content
+            Tuple of at most CTX_TURNS messages with role and content
         """
-        return self.conversation_history.get(session_id, [])
+        state = self.sessions.get(session_id)
+        if state is None:
+            return ()
+        
+        self.sessions.move_to_end(session_id)
+        return tuple(state.history)
     
     def add_message(self, session_id: str, role: str, content: str):
         """
         Add a message to conversation history.
         
+        Messages for sessions that are no longer tracked (disconnected or
+        evicted) are ignored.
+        
         Args:
             session_id: Session identifier
             role: Message role (user/assistant/tool)
             content: Message content
         """
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
+        state = self.sessions.get(session_id)
+        if state is None:
+            return
         
-        self.conversation_history[session_id].append({
+        self.sessions.move_to_end(session_id)
+        if role == "user" and state.opening is None:
+            state.opening = content
+        state.history.append({
             "role": role,
             "content": content
         })
@@ -107,7 +612,124 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+async def _send_tokens(session: SessionState, token_buf: List[str]) -> None:
+    """
+    Send buffered tokens as a single token frame and clear the buffer.
+    
+    Args:
+        session: Session whose current connection receives the frame
+        token_buf: Buffered token strings (emptied in place)
+    """
+    if token_buf:
+        await session.send(_encode_tokens(token_buf))
+        token_buf.clear()
+
+
+async def _answer(session_id: str, session: SessionState, user_message: str) -> None:
+    """
+    Answer one user message: record it, stream the AI response, record that.
+    
+    Frames go to the session's current connection, so a reply continues on
+    a connection that replaced the one the message came in on.
+    
+    Args:
+        session_id: Session identifier
+        session: The session's state
+        user_message: Message text received from the client
+    """
+    loop = asyncio.get_running_loop()
+    
+    log.debug("[WebSocket] Received from %s: %s", session_id, user_message)
+    
+    # Add user message to conversation history
+    manager.add_message(session_id, "user", user_message)
+    
+    # Queue user message for batched persistence
+    await insert_event(session_id, "user", user_message)
+    
+    # Immutable snapshot of the bounded history for context
+    conversation = manager.get_conversation_history(session_id)
+    
+    # Stream AI response
+    response_parts: List[str] = []
+    token_buf: List[str] = []
+    last_flush = loop.time()
+    
+    async for chunk_type, chunk_content in stream_llm_response(
+        conversation, session_id, session.opening
+    ):
+        if chunk_type == TOKEN:
+            # Coalesce tokens into fewer, larger frames
+            token_buf.append(chunk_content)
+            response_parts.append(chunk_content)
+            
+            if (
+                len(token_buf) >= TOKEN_FLUSH_COUNT
+                or loop.time() - last_flush > TOKEN_FLUSH_INTERVAL
+            ):
+                await _send_tokens(session, token_buf)
+                last_flush = loop.time()
+            continue
+        
+        if chunk_type == TOOL_HISTORY:
+            # Keep the tool result in conversation history
+            manager.add_message(session_id, "tool", chunk_content)
+            continue
+        
+        # Keep ordering: buffered tokens go out before any other frame
+        await _send_tokens(session, token_buf)
+        last_flush = loop.time()
+        
+        # Frames have the {"type", "content"} shape; only the
+        # content needs encoding
+        await session.send(_encode_frame(chunk_type, chunk_content))
+        
+        if chunk_type == TOOL_RESULT:
+            # Queue tool event for batched persistence
+            await insert_event(session_id, "tool", chunk_content)
+    
+    # Flush remaining tokens, then send end-of-stream marker
+    await _send_tokens(session, token_buf)
+    await session.send(END_FRAME)
+    
+    # Join the streamed tokens once, instead of growing a string per token
+    full_response = "".join(response_parts)
+    
+    # Add assistant response to conversation history
+    manager.add_message(session_id, "assistant", full_response)
+    
+    # Queue assistant message for batched persistence
+    await insert_event(session_id, "assistant", full_response)
+    
+    log.debug("[WebSocket] Sent response to %s", session_id)
+
+
 async def handle_websocket(websocket: WebSocket, session_id: str):
+    """
+    Admit a WebSocket session and run it.
+    
+    At most MAX_WS_SESSIONS sessions run concurrently; connections beyond
+    that are accepted and immediately closed with code 1013 (try again later)
+    instead of queuing more work on the event loop.
+    
+    Args:
+        websocket: WebSocket connection
+        session_id: Unique session identifier
+    """
+    if _admission.locked():
+        log.warning("[WebSocket] Rejecting %s: session limit reached", session_id)
+        await websocket.accept()
+        await websocket.close(code=1013)
+        return
+    
+    await _admission.acquire()
+    try:
+        await _run_session(websocket, session_id)
+    finally:
+        _admission.release()
+
+
+async def _run_session(websocket: WebSocket, session_id: str):
     """
     Main WebSocket handler for a session.
     
@@ -124,119 +746,69 @@ async def handle_websocket(websocket: WebSocket, session_id: str):
         session_id: Unique session identifier
     """
     # Connect and initialize session
-    await manager.connect(websocket, session_id)
+    connection = await manager.connect(websocket, session_id)
+    session = connection.session
     
     try:
         # Send welcome message
-        await websocket.send_json({
+        await session.send(orjson.dumps({
             "type": "system",
             "content": f"Connected to session: {session_id}"
-        })
+        }))
         
         # Main message loop
         while True:
-            # Receive message from client
-            data = await websocket.receive_text()
+            # Receive the raw ASGI message; the decoder parses binary and text
+            # frames as they arrive, with no extra decode or encode step
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            
+            data = message.get("bytes") or message.get("text") or b""
+            
+            # Reject empty pings and other frames without a message unparsed
+            if len(data) < _MIN_MESSAGE_LEN or not any(
+                marker in data for marker in _MESSAGE_MARKERS[type(data)]
+            ):
+                await session.send(EMPTY_ERR)
+                continue
             
             try:
-                message_data = json.loads(data)
-                user_message = message_data.get("message", "")
+                message_data = _decode_message(data)
                 
-                if not user_message:
-                    await websocket.send_json({
-                        "type": "error",
-                        "content": "Empty message received"
-                    })
+                # {"type": "resume", "from": N}: resend retained frames from seq N
+                if message_data.type == "resume":
+                    await connection.replay(message_data.resume_from)
                     continue
                 
-                print(f"[WebSocket] Received from {session_id}: {user_message}")
-                
-                # Add user message to conversation history
-                manager.add_message(session_id, "user", user_message)
-                
-                # Persist user message to database (async, non-blocking)
-                asyncio.create_task(insert_event(session_id, "user", user_message))
-                
-                # Get conversation history for context
-                conversation = manager.get_conversation_history(session_id)
-                
-                # Stream AI response
-                full_response = ""
-                tool_content = ""
+                user_message = message_data.message
                 
-                async for chunk in stream_llm_response(conversation, session_id):
-                    chunk_type = chunk["type"]
-                    chunk_content = chunk["content"]
-                    
-                    if chunk_type == "token":
-                        # Stream text token to client
-                        await websocket.send_json({
-                            "type": "token",
-                            "content": chunk_content
-                        })
-                        full_response += chunk_content
-                    
-                    elif chunk_type == "tool_call":
-                        # Send tool call notification
-                        await websocket.send_json({
-                            "type": "tool_call",
-                            "content": chunk_content
-                        })
-                        tool_content += chunk_content + "\n"
-                    
-                    elif chunk_type == "tool_result":
-                        # Send tool result
-                        await websocket.send_json({
-                            "type": "tool_result",
-                            "content": chunk_content
-                        })
-                        tool_content += chunk_content + "\n"
-                        
-                        # Persist tool event to database
-                        asyncio.create_task(
-                            insert_event(session_id, "tool", chunk_content)
-                        )
-                    
-                    elif chunk_type == "error":
-                        # Send error
-                        await websocket.send_json({
-                            "type": "error",
-                            "content": chunk_content
-                        })
-                
-                # Send end-of-stream marker
-                await websocket.send_json({
-                    "type": "end",
-                    "content": ""
-                })
-                
-                # Add assistant response to conversation history
-                manager.add_message(session_id, "assistant", full_response)
-                
-                # Persist assistant message to database (async, non-blocking)
-                asyncio.create_task(insert_event(session_id, "assistant", full_response))
+                if not user_message:
+                    await session.send(EMPTY_ERR)
+                    continue
                 
-                print(f"[WebSocket] Sent response to {session_id}")
+                # One turn at a time per session, also across connections
+                async with session.turn:
+                    await _answer(session_id, session, user_message)
             
-            except json.JSONDecodeError:
-                await websocket.send_json({
-                    "type": "error",
-                    "content": "Invalid JSON format"
-                })
+            except msgspec.DecodeError:
+                # Also raised (as ValidationError) for well-formed JSON that
+                # does not match InMsg
+                await session.send(INVALID_JSON)
             
             except Exception as e:
-                print(f"[WebSocket] Error processing message: {e}")
-                await websocket.send_json({
+                log.error("[WebSocket] Error processing message: %s", e)
+                await session.send(orjson.dumps({
                     "type": "error",
                     "content": f"Error processing message: {str(e)}"
-                })
+                }))
     
     except WebSocketDisconnect:
-        print(f"[WebSocket] Client disconnected normally: {session_id}")
+        log.debug("[WebSocket] Client disconnected normally: %s", session_id)
     
     except Exception as e:
-        print(f"[WebSocket] Unexpected error for {session_id}: {e}")
+        log.error("[WebSocket] Unexpected error for %s: %s", session_id, e)
     
     finally:
         # Cleanup and trigger post-session processing
-        await manager.disconnect(session_id)
+        await manager.disconnect(session_id, connection)